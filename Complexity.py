@@ -1,25 +1,30 @@
 import streamlit as st
+import functools
 import os
 import json
 
+# Keywords that indicate a more complex query; frozenset for O(1) membership
+KEYWORDS = frozenset({"compare", "cross-jurisdictional", "audit", "framework", "guidelines"})
+
 def calculate_complexity_score(query):
     score = 0
-    
+    query_lower = query.lower()
+    words = query_lower.split()
+
     # Add points for query length
-    score += len(query.split()) // 5  # 1 point for every 5 words
-    
+    score += len(words) // 5  # 1 point for every 5 words
+
     # Add points for specific keywords
-    keywords = ["compare", "cross-jurisdictional", "audit", "framework", "guidelines"]
-    score += sum(1 for word in query.split() if word.lower() in keywords)
-    
+    score += sum(1 for word in words if word in KEYWORDS)
+
     # Add points for references to multiple concepts
     if "and" in query or "," in query:
         score += 2
-    
+
     # Adjust points based on question type
-    if query.lower().startswith(("how", "why")):
+    if query_lower.startswith(("how", "why")):
         score += 3
-    
+
     return score
 
 def determine_top_k(score):
@@ -42,8 +47,9 @@ def format_complexity_display(score: int) -> str:
         return "🔴 High Complexity (Score: {})".format(score)
 
 
+@functools.lru_cache(maxsize=1)
 def load_secrets():
-    """Load secrets from Streamlit or local secrets.json"""
+    """Load secrets from Streamlit or local secrets.json (cached across reruns)"""
     try:
         # Try Streamlit secrets first
         return {
@@ -1,18 +1,26 @@
 import fitz  # PyMuPDF
-import json
+import orjson
 import re
 import os
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Configuration
 INPUT_DIR = r"C:\Users\gallo\source\VSCode\RegulationsProject\LanchainProcessedDocs"
 OUTPUT_DIR = os.path.join(INPUT_DIR, "processed_documents")
 
+# Compiled once; chunk_text calls this per sentence so per-call re.compile
+# lookups add up on large documents
+TOKEN_PATTERN = re.compile(r'\w+|\S')
+ABBREV_PATTERN = re.compile(r'\b(Mr|Ms|Dr|Prof|e\.g|i\.e|Fig|Vol)\.')
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+(?=[A-Z])')
+KEYWORD_PATTERN = re.compile(r'\b\w{5,}\b')
+
 def generate_metadata(chunk, document_name, section_name):
     """Generate metadata for a given chunk of text."""
     timestamp = datetime.utcnow().isoformat() + "Z"
-    keywords = list(set(re.findall(r'\b\w{5,}\b', chunk)))  # Extract keywords (words with 5+ letters)
+    keywords = list(set(KEYWORD_PATTERN.findall(chunk)))  # Extract keywords (words with 5+ letters)
     summary = chunk[:200] + ("..." if len(chunk) > 200 else "")  # Simple summary (first 200 chars)
 
     return {
@@ -26,16 +34,9 @@ def generate_metadata(chunk, document_name, section_name):
 def split_into_sentences(text):
     """Split text into sentences using regex while handling common abbreviations."""
     text = ' '.join(text.split())
-    text = re.sub(r'(?<=Mr)\.', '@', text)
-    text = re.sub(r'(?<=Ms)\.', '@', text)
-    text = re.sub(r'(?<=Dr)\.', '@', text)
-    text = re.sub(r'(?<=Prof)\.', '@', text)
-    text = re.sub(r'(?<=e\.g)\.', '@', text)
-    text = re.sub(r'(?<=i\.e)\.', '@', text)
-    text = re.sub(r'(?<=Fig)\.', '@', text)
-    text = re.sub(r'(?<=Vol)\.', '@', text)
-
-    sentences = re.split(r'(?<=[.!?])\s+(?=[A-Z])', text)
+    text = ABBREV_PATTERN.sub(r'\1@', text)
+
+    sentences = SENTENCE_PATTERN.split(text)
     sentences = [s.replace('@', '.') for s in sentences]
     return sentences
 
@@ -47,7 +48,7 @@ def chunk_text(text, min_tokens=150, max_tokens=250):
     current_token_count = 0
 
     for sentence in sentences:
-        sentence_tokens = len(re.findall(r'\w+|\S', sentence))
+        sentence_tokens = len(TOKEN_PATTERN.findall(sentence))
 
         if current_token_count + sentence_tokens > max_tokens and current_chunk:
             chunks.append(' '.join(current_chunk))
@@ -74,55 +75,57 @@ def extract_sections_from_pdf(pdf_path, document_name):
     doc = fitz.open(pdf_path)
     sections = []
     current_section = None
+    bold_fonts = {}  # font name -> is bold, so the substring scan runs once per font
+
+    def flush_current_section():
+        """Chunk the accumulated section text and append it to sections."""
+        if current_section and current_section["text_parts"]:
+            chunked_text = chunk_text(" ".join(current_section["text_parts"]))
+            for chunk in chunked_text:
+                if chunk.strip():
+                    metadata = generate_metadata(
+                        chunk, document_name, current_section["section_name"]
+                    )
+                    sections.append({
+                        "section_name": current_section["section_name"],
+                        "page_start": current_section["page_start"],
+                        "text": chunk.strip(),
+                        "metadata": metadata
+                    })
 
     try:
         for page_num in range(doc.page_count):
             page = doc[page_num]
-            text_blocks = page.get_text("dict", flags=fitz.TEXT_PRESERVE_LIGATURES)["blocks"]
+            # Build the TextPage directly: get_text("dict") creates and throws
+            # away a TextPage internally, and extractDICT skips image blocks
+            textpage = page.get_textpage(flags=fitz.TEXT_PRESERVE_LIGATURES)
+            text_blocks = textpage.extractDICT()["blocks"]
+            textpage = None
 
             for block in text_blocks:
                 for line in block.get("lines", []):
                     for span in line.get("spans", []):
-                        font_name = span.get("font", "").lower()
-                        font_size = span.get("size", 0)
                         span_text = span["text"].strip()
+                        if not span_text:
+                            continue
 
-                        if ("bold" in font_name or font_size > 12) and len(span_text) > 0:
-                            if current_section and current_section["text"]:
-                                chunked_text = chunk_text(current_section["text"])
-                                for chunk in chunked_text:
-                                    if chunk.strip():
-                                        metadata = generate_metadata(
-                                            chunk, document_name, current_section["section_name"]
-                                        )
-                                        sections.append({
-                                            "section_name": current_section["section_name"],
-                                            "page_start": current_section["page_start"],
-                                            "text": chunk.strip(),
-                                            "metadata": metadata
-                                        })
+                        font_name = span.get("font", "")
+                        is_bold = bold_fonts.get(font_name)
+                        if is_bold is None:
+                            is_bold = "bold" in font_name.lower()
+                            bold_fonts[font_name] = is_bold
 
+                        if is_bold or span.get("size", 0) > 12:
+                            flush_current_section()
                             current_section = {
                                 "section_name": span_text,
                                 "page_start": page_num + 1,
-                                "text": ""
+                                "text_parts": []
                             }
                         elif current_section:
-                            current_section["text"] += " " + span_text
+                            current_section["text_parts"].append(span_text)
 
-        if current_section and current_section["text"]:
-            chunked_text = chunk_text(current_section["text"])
-            for chunk in chunked_text:
-                if chunk.strip():
-                    metadata = generate_metadata(
-                        chunk, document_name, current_section["section_name"]
-                    )
-                    sections.append({
-                        "section_name": current_section["section_name"],
-                        "page_start": current_section["page_start"],
-                        "text": chunk.strip(),
-                        "metadata": metadata
-                    })
+        flush_current_section()
 
     finally:
         doc.close()
@@ -131,28 +134,42 @@ def extract_sections_from_pdf(pdf_path, document_name):
 
 def save_to_file(data, output_file):
     """Save extracted sections to a JSON file."""
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4)
+    # 1 MiB buffer: extracted section files run to multiple MB, and the
+    # default 8 KiB buffer means thousands of write syscalls per file
+    with open(output_file, "wb", buffering=1 << 20) as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
     print(f"Extracted sections saved to {output_file}")
 
+def process_single_pdf(input_dir, output_dir, pdf_file):
+    """Extract and save one PDF; returns the PDF name and any error message."""
+    pdf_path = os.path.join(input_dir, pdf_file)
+    output_file = os.path.join(output_dir, f"{os.path.splitext(pdf_file)[0]}_processed.json")
+
+    try:
+        extracted_sections = extract_sections_from_pdf(pdf_path, pdf_file)
+        save_to_file(extracted_sections, output_file)
+        return pdf_file, None
+    except Exception as e:
+        return pdf_file, str(e)
+
 def process_directory(input_dir, output_dir):
-    """Process all PDF files in the input directory and save results to output directory."""
+    """Process all PDF files in the input directory in parallel and save results to output directory."""
     Path(output_dir).mkdir(parents=True, exist_ok=True)
     pdf_files = [f for f in os.listdir(input_dir) if f.lower().endswith('.pdf')]
 
-    for pdf_file in pdf_files:
-        print(f"Processing {pdf_file}...")
-        pdf_path = os.path.join(input_dir, pdf_file)
-        output_file = os.path.join(output_dir, f"{os.path.splitext(pdf_file)[0]}_processed.json")
-
-        try:
-            extracted_sections = extract_sections_from_pdf(pdf_path, pdf_file)
-            save_to_file(extracted_sections, output_file)
-            print(f"Successfully processed {pdf_file}")
-
-        except Exception as e:
-            print(f"Error processing {pdf_file}: {str(e)}")
-            continue
+    # One process per file: the span loop and chunking are Python-bound,
+    # so threads would serialize on the GIL
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = {
+            executor.submit(process_single_pdf, input_dir, output_dir, pdf_file): pdf_file
+            for pdf_file in pdf_files
+        }
+        for future in as_completed(futures):
+            pdf_file, error = future.result()
+            if error:
+                print(f"Error processing {pdf_file}: {error}")
+            else:
+                print(f"Successfully processed {pdf_file}")
 
 if __name__ == "__main__":
     process_directory(INPUT_DIR, OUTPUT_DIR)
@@ -1,15 +1,11 @@
 # First: Imports
+# sentence_transformers (torch), pinecone and openai are imported lazily
+# inside their cache_resource initializers to keep Streamlit cold start fast
 import streamlit as st
-import pinecone
-from sentence_transformers import SentenceTransformer
-from openai import OpenAI
 import re
-import json
 import Complexity
-from search_utils import search_regulations, generate_embedding
-import search_utils
+from search_utils import search_regulations
 import utils
-import tiktoken
 
 # Second: Page Configuration
 st.set_page_config(page_title="Banking Regulations Chatbot", page_icon="📚", layout="wide")
@@ -24,14 +20,25 @@ OPENAI_API_KEY = secrets["OPENAI_API_KEY"]
 #Parameters
 MATCH_THRESHOLD = 0.5
 MAX_TOKENS = 800
+GPT_MODEL = "gpt-4o-mini"
 
 
 NAMESPACES = [
-    "ECB_GIM_Feb24", 
-    "ECB_TRIM2017", 
-    "PRA_ss123", 
+    "ECB_GIM_Feb24",
+    "ECB_TRIM2017",
+    "PRA_ss123",
     "FED_sr1107a1",
-    "JFSA_2021"              
+    "JFSA_2021"
+]
+
+# Citation clean-up passes applied to every GPT response, compiled once.
+# Order matters: number fixes first, then page format, then bracket styles.
+CITATION_FIXES = [
+    (re.compile(r'\b(\d+)\.0\b'), r'\1'),                      # 7.0 -> 7
+    (re.compile(r'[Pp]age:?\s*(\d+)'), r'p. \1'),              # Page 7 / page: 7 -> p. 7
+    (re.compile(r'\[([^,]+?),\s*p\.\s*(\d+)\]'), r'(\1, p. \2)'),
+    (re.compile(r'\{([^,]+?),\s*p\.\s*(\d+)\}'), r'(\1, p. \2)'),
+    (re.compile(r'\(([^,]+?)\s*,\s*p\.\s*(\d+)\)'), r'(\1, p. \2)'),
 ]
 
 # Fourth: Utility Functions
@@ -42,37 +49,62 @@ def get_friendly_document_name(doc_name: str) -> str:
     """
     # Remove .json extension if present
     doc_name = doc_name.replace('.json', '')
-    
-    # # Add processed_ prefix if not present
-    # if not doc_name.startswith('processed_'):
-    #     doc_name = f'processed_{doc_name}'
-    
-    # # Add _processed suffix if not present
-    # if not doc_name.endswith('_processed'):
-    #     doc_name = f'{doc_name}_processed'
-    
-    document_mapping = {
-        "ECB_GIM_Feb24": "ECB GIM 2024",
-        "ECB_TRIM2017": "ECB TRIM 2017",
-        "PRA_ss123": "PRA SS1/23",
-        "JFSA_2021": "JFSA 2021",
-        "FED_sr1107a1": "FED SR 11-7"
-    }
-    return document_mapping.get(doc_name, doc_name)
+    return DOCUMENT_MAPPING.get(doc_name, doc_name)
 
 # Fifth: Initialization Functions
 @st.cache_resource
 def initialize_model():
-    return SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+    from sentence_transformers import SentenceTransformer
+
+    try:
+        # int8 ONNX export: 2-4x faster query embedding on CPU, same 768-dim space
+        model = SentenceTransformer(
+            'sentence-transformers/all-mpnet-base-v2',
+            backend="onnx",
+            model_kwargs={"file_name": "onnx/model_qint8_avx512_vnni.onnx"}
+        )
+    except Exception as e:
+        print(f"ONNX backend unavailable, falling back to PyTorch: {str(e)}")
+        import os
+        import torch
+
+        if torch.cuda.is_available():
+            device = "cuda"
+        elif torch.backends.mps.is_available():
+            device = "mps"
+        else:
+            device = "cpu"
+            torch.set_num_threads(max(1, os.cpu_count() // 2))
+
+        # fp16 on accelerators; on x86 CPUs half precision is slower than fp32
+        model_kwargs = {"torch_dtype": torch.float16} if device != "cpu" else {}
+        model = SentenceTransformer(
+            'sentence-transformers/all-mpnet-base-v2',
+            device=device,
+            model_kwargs=model_kwargs
+        )
+
+    # Warm-up encode inside the cached loader: the first forward pass pays
+    # for lazy weight allocation and kernel selection, so it happens once
+    # at startup instead of on the first user query
+    model.encode("warmup")
+    return model
 
 @st.cache_resource
 def initialize_pinecone():
     try:
-        pc = pinecone.Pinecone(api_key=PINECONE_API_KEY)
+        # gRPC speaks protobuf over one multiplexed HTTP/2 connection, so the
+        # 768-float vector is sent in binary instead of JSON per query
+        from pinecone.grpc import PineconeGRPC as Pinecone
+    except ImportError:
+        from pinecone import Pinecone
+
+    try:
+        pc = Pinecone(api_key=PINECONE_API_KEY)
         try:
-            index = pc.Index(INDEX_NAME)
-            stats = index.describe_index_stats()
-            return index
+            # No stats probe here: it costs a network round trip on every
+            # cold start, and search_regulations checks the index anyway
+            return pc.Index(INDEX_NAME)
         except Exception as e:
             st.error(f"Error accessing index '{INDEX_NAME}': {str(e)}")
             return None
@@ -82,106 +114,117 @@ def initialize_pinecone():
 
 @st.cache_resource
 def initialize_openai():
+    from openai import OpenAI
+
     return OpenAI(api_key=OPENAI_API_KEY)
 
+# Static lookups, built once at import
+DOCUMENT_MAPPING = {
+    "ECB_GIM_Feb24": "ECB GIM 2024",
+    "ECB_TRIM2017": "ECB TRIM 2017",
+    "PRA_ss123": "PRA SS1/23",
+    "JFSA_2021": "JFSA 2021",
+    "FED_sr1107a1": "FED SR 11-7"
+}
+
+DISPLAY_NAMES = {
+    "ECB_GIM_Feb24": "ECB GIM Feb 2024",
+    "ECB_TRIM2017": "ECB TRIM 2017",
+    "PRA_ss123": "PRA SS1/23",
+    "JFSA_2021": "JFSA 2021",
+    "FED_sr1107a1": "FED SR 11-7a1"
+}
+
+DOCUMENT_LINKS = {
+    "ECB_GIM_Feb24": "https://www.bankingsupervision.europa.eu/ecb/pub/pdf/ssm.supervisory_guides202402_internalmodels.en.pdf",
+    "ECB_TRIM2017": "https://www.bankingsupervision.europa.eu/ecb/pub/pdf/trim_guide.en.pdf",
+    "PRA_ss123": "https://www.bankofengland.co.uk/-/media/boe/files/prudential-regulation/supervisory-statement/2023/ss123.pdf",
+    "JFSA_2021": "https://www.fsa.go.jp/en/news/2021/20210730-1.html",
+    "FED_sr1107a1": "https://www.federalreserve.gov/supervisionreg/srletters/sr1107.pdf"
+}
+
+SYSTEM_PROMPT = (
+    "You are a regulatory expert specializing in model risk management. "
+    "When referencing documents, integrate citations naturally into your text "
+    "using this exact format: (Document Name, p. X). For example: 'According "
+    "to guidance (ECB GIM 2024, p. 5), model risk management should...' "
+    "Your role is to synthesize information across different regulatory "
+    "documents, compare perspectives, and provide comprehensive answers "
+    "that integrate insights from all relevant sources. Always weave citations "
+    "naturally into your sentences. Never use underscores or 'processed' in document names."
+    "If the question asked does not make logical or grammatical or semantic sense, say so and do not reply. "
+    "If you are asked to summarize or be brief or concise, aim for clear and informative responses. "
+    "Provide answers with the limit of {MAX_TOKENS} tokens."
+)
+
+# Built once: the instruction preamble is identical for every query
+PROMPT_PREAMBLE = (
+    "You are a helpful assistant specializing in model risk management regulations. "
+    "Your task is to:\n"
+    "1. SYNTHESIZE information from ALL provided regulatory documents\n"
+    "2. COMPARE and CONTRAST different regulatory perspectives when available\n"
+    "3. HIGHLIGHT any differences or complementary views between documents\n"
+    "4. CREATE a comprehensive answer that integrates insights from all relevant sources\n"
+    "5. ALWAYS cite specific documents and page numbers for each key point\n\n"
+    "6. CHECK IF the question asked makes logical, grammatical, semantic AND contextual sense IF NOT THEN say so and do not reply.\n\n"
+    "When citing sources, write citations in running text like this: (ECB GIM 2024, p. 7)\n"
+    "Do not put citations at the end of paragraphs or in a separate section.\n\n"
+    "If you are asked to summarize or be brief or concise or similar, aim for shorter and informative responses\n\n"
+    "If only one document provides relevant information, explicitly state this and explain\n\n"
+    "what aspects other regulations might not cover.\n\n"
+)
+
 # Sixth: Core Processing Functions
 def create_synthetic_gpt_prompt(query: str, context: list) -> str:
-    prompt = (
-        "You are a helpful assistant specializing in model risk management regulations. "
-        "Your task is to:\n"
-        "1. SYNTHESIZE information from ALL provided regulatory documents\n"
-        "2. COMPARE and CONTRAST different regulatory perspectives when available\n"
-        "3. HIGHLIGHT any differences or complementary views between documents\n"
-        "4. CREATE a comprehensive answer that integrates insights from all relevant sources\n"
-        "5. ALWAYS cite specific documents and page numbers for each key point\n\n"
-        "6. CHECK IF the question asked makes logical, grammatical, semantic AND contextual sense IF NOT THEN say so and do not reply.\n\n"
-        "When citing sources, write citations in running text like this: (ECB GIM 2024, p. 7)\n"
-        "Do not put citations at the end of paragraphs or in a separate section.\n\n"
-        "If you are asked to summarize or be brief or concise or similar, aim for shorter and informative responses\n\n"    
-        "If only one document provides relevant information, explicitly state this and explain\n\n"
-        "what aspects other regulations might not cover.\n\n"
-    )
-    
     docs_context = {}
     for item in context:
         doc_name = get_friendly_document_name(item.metadata.get('document_title', 'N/A'))
         if doc_name not in docs_context:
             docs_context[doc_name] = []
         docs_context[doc_name].append(item)
-    
-    prompt += "Available Regulatory Context:\n"
+
+    # Build as a list and join once; += on strings recopies the whole prompt
+    parts = [PROMPT_PREAMBLE, "Available Regulatory Context:\n"]
     for doc_name, items in docs_context.items():
-        prompt += f"\nFrom {doc_name}:\n"
+        parts.append(f"\nFrom {doc_name}:\n")
         for item in items:
             metadata = item.metadata
             section = metadata.get('section_name', 'N/A')
             page = metadata.get('page_start', 'N/A')
             if metadata.get('text'):
-                prompt += f"- Section: {section}, Page: {page}\n{metadata['text']}\n"
+                parts.append(f"- Section: {section}, Page: {page}\n{metadata['text']}\n")
             else:
                 print(f"[DEBUG] Skipping item with missing text: {metadata}")
-    
-    prompt += "\nProvide a comprehensive answer that synthesizes all relevant regulatory perspectives:"
-    return prompt
-
-def get_gpt_response(client, prompt: str) -> str:
-    document_mapping = {
-        "ECB_GIM_Feb24": "ECB GIM 2024",
-        "ECB_TRIM2017": "ECB TRIM 2017",
-        "PRA_ss123": "PRA SS1/23",
-        "JFSA_2021": "JFSA 2021",
-        "FED_sr1107a1": "FED SR 11-7"
-    }
-    
-    
+
+    parts.append("\nProvide a comprehensive answer that synthesizes all relevant regulatory perspectives:")
+    return ''.join(parts)
+
+def fix_citations(text: str) -> str:
+    """Apply the citation clean-up passes to a complete response."""
+    for pattern, replacement in CITATION_FIXES:
+        text = pattern.sub(replacement, text)
+    return text
+
+def stream_gpt_response(client, prompt: str):
+    """Yield GPT response tokens as they are generated."""
     try:
         response = client.chat.completions.create(
-            model="gpt-4",
+            model=GPT_MODEL,
             messages=[
-                {"role": "system", "content": (
-                    "You are a regulatory expert specializing in model risk management. "
-                    "When referencing documents, integrate citations naturally into your text "
-                    "using this exact format: (Document Name, p. X). For example: 'According "
-                    "to guidance (ECB GIM 2024, p. 5), model risk management should...' "
-                    "Your role is to synthesize information across different regulatory "
-                    "documents, compare perspectives, and provide comprehensive answers "
-                    "that integrate insights from all relevant sources. Always weave citations "
-                    "naturally into your sentences. Never use underscores or 'processed' in document names."
-                    "If the question asked does not make logical or grammatical or semantic sense, say so and do not reply. "
-                    "If you are asked to summarize or be brief or concise, aim for clear and informative responses. "
-                    "Provide answers with the limit of {MAX_TOKENS} tokens."
-                )},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
-            max_tokens=MAX_TOKENS
+            max_tokens=MAX_TOKENS,
+            stream=True
         )
 
-        raw_response = response.choices[0].message.content
-        
-        # Fix floating point page numbers
-        fixed_response = re.sub(r'\b(\d+)\.0\b', r'\1', raw_response)
-        
-        # Standardize page number format
-        fixed_response = re.sub(r'Page:?\s*(\d+)', r'p. \1', fixed_response)
-        fixed_response = re.sub(r'page:?\s*(\d+)', r'p. \1', fixed_response)
-        
-        # # First pass: Handle processed names in citations
-        # for old_name, friendly_name in document_mapping.items():
-        #     old_pattern = rf'\((?:processed_)?{re.escape(old_name.replace("processed_", "").replace("_processed", ""))}(?:_processed)?(?:\.json)?,\s*p\.\s*(\d+)\)'
-        #     fixed_response = re.sub(old_pattern, rf'({friendly_name}, p. \1)', fixed_response)
-        
-        # Second pass: Clean up any remaining non-standard citation formats
-        fixed_response = re.sub(r'\[([^,]+?),\s*p\.\s*(\d+)\]', r'(\1, p. \2)', fixed_response)
-        fixed_response = re.sub(r'\{([^,]+?),\s*p\.\s*(\d+)\}', r'(\1, p. \2)', fixed_response)
-        
-        # Final pass: Ensure consistent spacing in citations
-        fixed_response = re.sub(r'\(([^,]+?)\s*,\s*p\.\s*(\d+)\)', r'(\1, p. \2)', fixed_response)
-            
-        return fixed_response
-    
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
     except Exception as e:
-        return f"Error generating response: {str(e)}"
+        yield f"Error generating response: {str(e)}"
 
 # Seventh: UI Functions
 def setup_page_header():
@@ -205,26 +248,10 @@ def setup_page_header():
 def setup_sidebar():
     with st.sidebar:
         st.title("Available Documents")
-        display_names = {
-            "ECB_GIM_Feb24": "ECB GIM Feb 2024",
-            "ECB_TRIM2017": "ECB TRIM 2017",
-            "PRA_ss123": "PRA SS1/23",
-            "JFSA_2021": "JFSA 2021",
-            "FED_sr1107a1": "FED SR 11-7a1"
-        }
-        
-        document_links = {
-            "ECB_GIM_Feb24": "https://www.bankingsupervision.europa.eu/ecb/pub/pdf/ssm.supervisory_guides202402_internalmodels.en.pdf",
-            "ECB_TRIM2017": "https://www.bankingsupervision.europa.eu/ecb/pub/pdf/trim_guide.en.pdf",
-            "PRA_ss123": "https://www.bankofengland.co.uk/-/media/boe/files/prudential-regulation/supervisory-statement/2023/ss123.pdf",
-            "JFSA_2021": "https://www.fsa.go.jp/en/news/2021/20210730-1.html",
-            "FED_sr1107a1": "https://www.federalreserve.gov/supervisionreg/srletters/sr1107.pdf"
-        }
-        
         for ns in NAMESPACES:
-            if ns in document_links:
-                display_name = display_names.get(ns, ns)
-                st.markdown(f"- [{display_name}]({document_links[ns]})")
+            if ns in DOCUMENT_LINKS:
+                display_name = DISPLAY_NAMES.get(ns, ns)
+                st.markdown(f"- [{display_name}]({DOCUMENT_LINKS[ns]})")
             else:
                 st.warning(f"No link found for namespace: {ns}")
 
@@ -326,21 +353,34 @@ def _display_reference_details(match):
 
 
 
+class CachedMatch:
+    """Picklable stand-in for a Pinecone match so search results can be cached."""
+    def __init__(self, match_id, score, metadata):
+        self.id = match_id
+        self.score = score
+        self.metadata = metadata
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def cached_search(query: str, _index, _model):
+    """Memoize the whole search fan-out by prompt; repeated questions skip the
+    encoder and all Pinecone round trips. Underscored args are not hashed."""
+    results = search_regulations(query, _index, _model)
+    return [CachedMatch(m.id, m.score, dict(m.metadata)) for m in results]
+
 def process_user_query(prompt, model, index, client):
-    results = search_regulations(prompt, index, model)
-    
+    results = cached_search(prompt, index, model)
+
     # Filter results based on MATCH_THRESHOLD
     filtered_results = [r for r in results if r.score > MATCH_THRESHOLD]
-    
+
     complexity_score = Complexity.calculate_complexity_score(prompt)
-    
+
     if filtered_results:
         gpt_prompt = create_synthetic_gpt_prompt(prompt, filtered_results)
-        gpt_response = get_gpt_response(client, gpt_prompt)
-        return filtered_results, complexity_score, gpt_response
+        return filtered_results, complexity_score, gpt_prompt
     else:
-        # Return empty results and a standard message when no matches meet the threshold
-        return [], complexity_score, "There is no matching information in the search documents. Please modify your query!"
+        # Return empty results; the caller shows the standard no-match message
+        return [], complexity_score, None
 
 
 def main():
@@ -361,23 +401,24 @@ def main():
         
         # Generate response
         with st.chat_message("assistant"):
-            message_placeholder = st.empty()
-            
             with st.spinner("Searching regulations..."):
-                results, complexity_score, gpt_response = process_user_query(prompt, model, index, client)
-                
+                results, complexity_score, gpt_prompt = process_user_query(prompt, model, index, client)
+
             st.markdown(Complexity.format_complexity_display(complexity_score))
-        
+
             if results:  # Only display references if we have results that meet the threshold
-                message_placeholder.markdown(gpt_response)
+                # Stream tokens as they arrive; citations are tidied on the full text
+                streamed_text = st.write_stream(stream_gpt_response(client, gpt_prompt))
+                gpt_response = fix_citations(streamed_text)
                 st.session_state.messages.append({
                     "role": "assistant",
                     "content": gpt_response
                 })
-                
+
                 display_references_by_complexity(results, complexity_score)
             else:
-                message_placeholder.markdown(gpt_response)  # This will show our "no matching information" message
+                gpt_response = "There is no matching information in the search documents. Please modify your query!"
+                st.markdown(gpt_response)
                 st.session_state.messages.append({
                     "role": "assistant",
                     "content": gpt_response
@@ -1,19 +1,125 @@
 import streamlit as st
-from sentence_transformers import SentenceTransformer
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
 import Complexity
+import functools
+import heapq
+import numpy as np
+import re
 import tiktoken
+import time
+
+# Namespaces and the query phrasings that select them; static, so built once
+NAMESPACE_DOCS = {
+    "ECB_GIM_Feb24": {
+        "display_name": "ECB GIM Feb 2024",
+        "variations": ["ecb gim", "gim feb 2024", "ecb guide", "ecb"]
+    },
+    "ECB_TRIM2017": {
+        "display_name": "ECB TRIM 2017",
+        "variations": ["ecb trim", "trim 2017", "trim guide", "trim"]
+    },
+    "PRA_ss123": {
+        "display_name": "PRA SS1/23",
+        "variations": ["pra", "ss1/23", "ss1 23", "pra ss", "ss1"]
+    },
+    "JFSA_2021": {
+        "display_name": "JFSA 2021",
+        "variations": ["jfsa", "japan fsa", "fsa"]
+    },
+    "FED_sr1107a1": {
+        "display_name": "FED SR 11-7a1",
+        "variations": ["fed", "sr 11-7", "sr11-7", "fed sr", "sr11"]
+    }
+}
+
+# One compiled whole-word alternation per namespace, built at import; matching
+# a query against a namespace is then a single scan instead of a fresh
+# re.escape + compile per variation
+NAMESPACE_PATTERNS = {
+    ns: re.compile(
+        r'\b(?:' + '|'.join(
+            re.escape(v) for v in [info["display_name"], *info["variations"]]
+        ) + r')\b',
+        re.IGNORECASE
+    )
+    for ns, info in NAMESPACE_DOCS.items()
+}
+
+@functools.lru_cache(maxsize=4)
+def get_encoding(model: str = "gpt-4"):
+    """Cache the tiktoken encoding; encoding_for_model reloads BPE data each call."""
+    return tiktoken.encoding_for_model(model)
 
 def count_tokens(text: str, model: str = "gpt-4") -> int:
-    encoding = tiktoken.encoding_for_model(model)
-    return len(encoding.encode(text))
+    return len(get_encoding(model).encode(text))
+
+def count_tokens_batch(texts: list, model: str = "gpt-4") -> list:
+    """Count tokens for many texts in one call; tiktoken's Rust batch path
+    is much faster than encoding text-by-text."""
+    encoding = get_encoding(model)
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
 
-def generate_embedding(text: str, model) -> list:
+# Query embeddings keyed by query text; users frequently re-ask the same
+# question and an MPNet forward pass on CPU costs ~100ms per query
+_embedding_cache = {}
+_EMBEDDING_CACHE_SIZE = 512
+
+def generate_embedding(text: str, model):
+    """Encode text to a float32 ndarray, or None on failure (cached by text).
+
+    Keeping the ndarray avoids boxing 768 Python floats per query; callers
+    convert to a list once where a JSON payload is required.
+    """
+    cached = _embedding_cache.get(text)
+    if cached is not None:
+        return cached
     try:
-        embedding = model.encode(text)
-        return embedding.tolist()
+        embedding = model.encode(text, convert_to_numpy=True).astype("float32", copy=False)
+        if len(_embedding_cache) >= _EMBEDDING_CACHE_SIZE:
+            _embedding_cache.clear()
+        _embedding_cache[text] = embedding
+        return embedding
     except Exception as e:
         st.error(f"Error generating embedding: {str(e)}")
-        return []
+        return None
+
+def generate_embeddings(texts: list, model):
+    """Encode many texts in one batched call, or None on failure.
+
+    Sorting by length before encoding keeps each batch padded only to its
+    own longest member instead of the global maximum; the results are
+    restored to input order before returning.
+    """
+    try:
+        order = np.argsort([len(t) for t in texts])
+        sorted_texts = [texts[i] for i in order]
+        embeddings = model.encode(
+            sorted_texts,
+            batch_size=64,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        ).astype("float32", copy=False)
+        unsorted = np.empty_like(embeddings)
+        unsorted[order] = embeddings
+        return unsorted
+    except Exception as e:
+        st.error(f"Error generating embeddings: {str(e)}")
+        return None
+
+# The emptiness check only guards against a misconfigured index, so the
+# stats round trip is paid at most once a minute rather than per search
+_STATS_TTL_SECONDS = 60
+_stats_cache = {"checked_at": 0.0, "total_vectors": 0}
+
+def get_total_vectors(index) -> int:
+    """Total vector count across namespaces, cached for a minute."""
+    now = time.time()
+    if now - _stats_cache["checked_at"] > _STATS_TTL_SECONDS:
+        stats = index.describe_index_stats()
+        _stats_cache["total_vectors"] = sum(ns.vector_count for ns in stats.namespaces.values())
+        _stats_cache["checked_at"] = now
+    return _stats_cache["total_vectors"]
 
 def determine_search_params(complexity_score: int) -> tuple:
     """Determine search parameters based on complexity score."""
@@ -34,13 +140,10 @@ def search_regulations(query: str, index, model) -> list:
     try:
         # Check index status
         try:
-            stats = index.describe_index_stats()
-            total_vectors = sum(ns.vector_count for ns in stats.namespaces.values())
-            
-            if total_vectors == 0:
+            if get_total_vectors(index) == 0:
                 st.error("Index appears to be empty")
                 return []
-                
+
         except Exception as e:
             st.error(f"Error checking index stats: {str(e)}")
             return []
@@ -51,120 +154,67 @@ def search_regulations(query: str, index, model) -> list:
         
         # Generate embedding
         query_embedding = generate_embedding(query, model)
-        if not query_embedding or len(query_embedding) != 768:
+        if query_embedding is None or len(query_embedding) != 768:
             st.error("Invalid embedding generated")
             return []
 
-                # Find exact word matches for namespaces
-        def find_word_matches(text, target):
-            """Find whole word matches, handling whitespace, punctuation, and case"""
-            import re
-            # Convert both text and target to lowercase for case-insensitive comparison
-            text = text.lower()
-            target = target.lower()
-            # Create a pattern that matches the whole word/phrase
-            pattern = r'\b' + re.escape(target) + r'\b'
-            return bool(re.search(pattern, text))
-
-        # Define namespaces and their variations
-        namespace_docs = {
-            "ECB_GIM_Feb24": {
-                "display_name": "ECB GIM Feb 2024",
-                "variations": ["ecb gim", "gim feb 2024", "ecb guide", "ecb"]
-            },
-            "ECB_TRIM2017": {
-                "display_name": "ECB TRIM 2017",
-                "variations": ["ecb trim", "trim 2017", "trim guide", "trim"]
-            },
-            "PRA_ss123": {
-                "display_name": "PRA SS1/23",
-                "variations": ["pra", "ss1/23", "ss1 23", "pra ss", "ss1"]
-            },
-            "JFSA_2021": {
-                "display_name": "JFSA 2021",
-                "variations": ["jfsa", "japan fsa", "fsa"]
-            },
-            "FED_sr1107a1": {
-                "display_name": "FED SR 11-7a1",
-                "variations": ["fed", "sr 11-7", "sr11-7", "fed sr", "sr11"]
-            }
+        # One list conversion shared by every namespace query; the client
+        # JSON-encodes the vector, so it needs Python floats exactly once
+        query_vector = query_embedding.tolist()
+
+        # Determine which namespaces to search based on query content:
+        # whole-word match of the display name or any variation
+        namespaces_to_search = {
+            namespace for namespace, pattern in NAMESPACE_PATTERNS.items()
+            if pattern.search(query)
         }
-        
-        # Determine which namespaces to search based on query content
-        namespaces_to_search = set()
-        
-        for namespace, info in namespace_docs.items():
-            # Check display name
-            if find_word_matches(query, info["display_name"]):
-                namespaces_to_search.add(namespace)
-                continue
-            
-            # Check variations
-            for variation in info["variations"]:
-                if find_word_matches(query, variation):
-                    namespaces_to_search.add(namespace)
-                    break
-        
+
         # If no specific namespaces mentioned, search all
         if not namespaces_to_search:
-            namespaces_to_search = set(namespace_docs.keys())
+            namespaces_to_search = set(NAMESPACE_DOCS.keys())
             st.info("No specific regulatory document mentioned - searching all documents.")
         else:
-            selected_docs = [namespace_docs[ns]["display_name"] for ns in namespaces_to_search]
+            selected_docs = [NAMESPACE_DOCS[ns]["display_name"] for ns in namespaces_to_search]
             st.info(f"Searching specifically in: {', '.join(selected_docs)}")
         
         all_matches = []
         used_ids = set()
-        
-        # First pass: Collect results from specified namespaces
-        for namespace in namespaces_to_search:
+
+        def query_namespace(namespace):
+            """Query one namespace; returns (namespace, matches, error)."""
             try:
                 # Query with a higher number of results to ensure we get all relevant matches
                 results = index.query(
-                    vector=query_embedding,
+                    vector=query_vector,
                     top_k=20,  # Increased to get more potential matches
                     include_metadata=True,
                     namespace=namespace,
                     include_values=False
                 )
-                
-                if results.matches:
-                    for match in results.matches:
-                        if match.id not in used_ids:
-                            match.metadata['namespace'] = namespace  # Ensure namespace is in metadata
-                            all_matches.append(match)
-                            used_ids.add(match.id)
-                            
+                return namespace, results.matches or [], None
             except Exception as e:
-                st.error(f"Error querying namespace {namespace}: {str(e)}")
+                return namespace, [], str(e)
+
+        # Fan out the per-namespace queries concurrently: each is a network
+        # round trip, so running them serially stacks up the full RTT per namespace.
+        # Streamlit calls stay on the main thread (st.error below, not in workers).
+        with ThreadPoolExecutor(max_workers=len(namespaces_to_search)) as executor:
+            query_results = list(executor.map(query_namespace, namespaces_to_search))
+
+        for namespace, matches, error in query_results:
+            if error:
+                st.error(f"Error querying namespace {namespace}: {error}")
                 continue
+            for match in matches:
+                if match.id not in used_ids:
+                    match.metadata['namespace'] = namespace  # Ensure namespace is in metadata
+                    all_matches.append(match)
+                    used_ids.add(match.id)
         
-        # Sort all results by score
-        all_matches.sort(key=lambda x: x.score, reverse=True)
-        
-        # If results_per_namespace is set, ensure minimum results from each namespace
-        if results_per_namespace > 0:
-            final_results = []
-            namespace_counts = {ns: 0 for ns in namespaces_to_search}
-            
-            # First, add minimum required results from each namespace
-            for match in all_matches:
-                namespace = match.metadata.get('namespace')
-                if namespace in namespace_counts and namespace_counts[namespace] < results_per_namespace:
-                    final_results.append(match)
-                    namespace_counts[namespace] += 1
-            
-            # Then add remaining top results up to max_results
-            remaining_slots = max_results - len(final_results)
-            if remaining_slots > 0:
-                for match in all_matches:
-                    if match not in final_results and len(final_results) < max_results:
-                        final_results.append(match)
-            
-            return final_results[:max_results]
-        
-        # If no minimum results per namespace required, simply return top matches
-        return all_matches[:max_results]
+        # Take the top matches with a bounded heap instead of sorting every
+        # candidate. determine_search_params always sets results_per_namespace
+        # to 0, so the old per-namespace backfill pass never ran and is gone.
+        return heapq.nlargest(max_results, all_matches, key=attrgetter('score'))
 
     except Exception as e:
         st.error(f"Error during search: {str(e)}")
@@ -4,6 +4,52 @@ import re
 import Complexity
 import search_utils
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+
+# Single worker keeps prompt files written in order while the request
+# thread moves straight on to the GPT call instead of waiting on disk
+_PROMPT_IO_POOL = ThreadPoolExecutor(max_workers=1)
+
+# Directories already created this session, so each prompt save skips the
+# stat + mkdir syscalls after the first write
+_ensured_dirs = set()
+
+
+def _ensure_dir(base_dir):
+    if base_dir not in _ensured_dirs:
+        os.makedirs(base_dir, exist_ok=True)
+        _ensured_dirs.add(base_dir)
+
+# Compiled once: get_gpt_response rewrites every GPT answer with these, so
+# the patterns shouldn't be re-fetched from re's cache per response
+NUM_DOT_ZERO_PATTERN = re.compile(r'\b(\d+)\.0\b')
+PAGE_PATTERN = re.compile(r'[Pp]age:?\s*(\d+)')
+SUMMARY_SPLIT_PATTERN = re.compile(r'(?m)^(?=Context from )')
+
+# Document identifiers checked by enhance_query_with_summary; static, so the
+# dict and the lowercase variants used for matching are built once
+DOC_IDENTIFIERS = {
+    "SR117": ["SR117", "SR-11-7", "SR 11-7", "FED_SR117"],
+    "ECB_GIM": ["ECB_GIM", "GIM", "ECB GIM", "ECB_GIM_Feb24"],
+    "SS123": ["SS123", "SS-123", "SS 123", "PRA_ss123"],
+    "TRIM": ["TRIM", "ECB TRIM", "ECB_TRIM2017", "TRIM2017"]
+}
+DOC_IDENTIFIERS_LOWER = {
+    base_id: tuple(var.lower() for var in variations)
+    for base_id, variations in DOC_IDENTIFIERS.items()
+}
+
+# One alternation over every variation (longest first, so "ecb gim" beats
+# "gim"): the prompt is scanned once instead of once per variation
+VARIANT_TO_BASE = {
+    var: base_id
+    for base_id, variations in DOC_IDENTIFIERS_LOWER.items()
+    for var in variations
+}
+DOC_ID_PATTERN = re.compile(
+    '|'.join(re.escape(var) for var in sorted(VARIANT_TO_BASE, key=len, reverse=True))
+)
 
 
 
@@ -12,25 +58,22 @@ def enhance_query_with_summary(prompt, summaries):
     """
     Check if the prompt relates to any available document and enhance it with summary information.
     """
-    # List of document identifiers to check against
-    doc_identifiers = {
-        "SR117": ["SR117", "SR-11-7", "SR 11-7", "FED_SR117"],
-        "ECB_GIM": ["ECB_GIM", "GIM", "ECB GIM", "ECB_GIM_Feb24"],
-        "SS123": ["SS123", "SS-123", "SS 123", "PRA_ss123"],
-        "TRIM": ["TRIM", "ECB TRIM", "ECB_TRIM2017", "TRIM2017"]
-    }
-    
     # Convert prompt to lowercase for case-insensitive matching
     prompt_lower = prompt.lower()
-    
+
     enhanced_prompt = prompt
-    
-    for base_id, variations in doc_identifiers.items():
-        # Check if any variation of the document identifier is in the prompt
-        if any(var.lower() in prompt_lower for var in variations):
+
+    # Single scan of the prompt for every identifier at once; the per-base
+    # substring checks below then run only against the bases actually seen
+    matched_bases = {
+        VARIANT_TO_BASE[m.group(0)] for m in DOC_ID_PATTERN.finditer(prompt_lower)
+    }
+
+    for base_id in DOC_IDENTIFIERS:
+        if base_id in matched_bases:
             # Try to find the corresponding summary
             summary = None
-            for var in variations:
+            for var in DOC_IDENTIFIERS[base_id]:
                 if var in summaries:
                     summary = summaries[var]
                     break
@@ -44,7 +87,7 @@ def enhance_query_with_summary(prompt, summaries):
 
 
 
-from datetime import datetime
+import time
 import os
 
 def save_gpt_prompt(gpt_prompt: str, base_dir: str = "prompts") -> str:
@@ -58,12 +101,16 @@ def save_gpt_prompt(gpt_prompt: str, base_dir: str = "prompts") -> str:
     Returns:
         str: The path to the saved file
     """
-    # Create the directory if it doesn't exist
-    if not os.path.exists(base_dir):
-        os.makedirs(base_dir)
-    
-    # Generate timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Create the directory if it doesn't exist (cached after the first call)
+    _ensure_dir(base_dir)
+
+    # Generate timestamp; formatting the struct_time directly skips the
+    # datetime allocation and locale-aware strftime parsing
+    t = time.localtime()
+    timestamp = (
+        f"{t.tm_year:04d}{t.tm_mon:02d}{t.tm_mday:02d}"
+        f"_{t.tm_hour:02d}{t.tm_min:02d}{t.tm_sec:02d}"
+    )
     
     # Create filename with timestamp
     filename = f"gpt_prompt_{timestamp}.txt"
@@ -90,9 +137,8 @@ def save_gpt_prompt2(gpt_prompt: str, base_dir: str = "prompts") -> str:
     Returns:
         str: The path to the saved file
     """
-    # Create the directory if it doesn't exist
-    if not os.path.exists(base_dir):
-        os.makedirs(base_dir)
+    # Create the directory if it doesn't exist (cached after the first call)
+    _ensure_dir(base_dir)
 
     # Use a fixed filename
     filename = "gpt_prompt.txt"
@@ -107,10 +153,29 @@ def save_gpt_prompt2(gpt_prompt: str, base_dir: str = "prompts") -> str:
         print(f"Error saving prompt to file: {str(e)}")
         return None
 
+def persist_prompt(gpt_prompt: str, base_dir: str = "prompts"):
+    """
+    Persist the prompt once: write the timestamped file, then hardlink the
+    fixed-name copy to it instead of encoding and writing the text twice.
+    """
+    saved_path = save_gpt_prompt(gpt_prompt, base_dir)
+    if saved_path:
+        fixed_path = os.path.join(base_dir, "gpt_prompt.txt")
+        try:
+            if os.path.exists(fixed_path):
+                os.unlink(fixed_path)
+            os.link(saved_path, fixed_path)
+            return
+        except OSError:
+            # Filesystem without hardlinks; fall back to a second write
+            pass
+    save_gpt_prompt2(gpt_prompt, base_dir)
+
+
 def get_gpt_response(client, prompt: str) -> str:
     try:
         response = client.chat.completions.create(
-            model="gpt-4",
+            model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": (
                     "You are a regulatory expert specializing in model risk management. "
@@ -128,9 +193,8 @@ def get_gpt_response(client, prompt: str) -> str:
 
         raw_response = response.choices[0].message.content
         # Remove .0 from numbers and ensure consistent page number format
-        fixed_response = re.sub(r'\b(\d+)\.0\b', r'\1', raw_response)
-        fixed_response = re.sub(r'Page:?\s*(\d+)', r'p. \1', fixed_response)
-        fixed_response = re.sub(r'page:?\s*(\d+)', r'p. \1', fixed_response)
+        fixed_response = NUM_DOT_ZERO_PATTERN.sub(r'\1', raw_response)
+        fixed_response = PAGE_PATTERN.sub(r'p. \1', fixed_response)
         return fixed_response
     
     except Exception as e:
@@ -138,37 +202,26 @@ def get_gpt_response(client, prompt: str) -> str:
 
    
 def create_synthetic_gpt_prompt(query: str, context: list) -> str:
-    # Extract any summaries from the query (they follow "Context from" markers)
-    summary_sections = []
-    query_lines = query.split('\n')
-    clean_query = []
-    current_summary = []
-    in_summary = False
-    
-    for line in query_lines:
-        line = line.strip()  # Handle any extra whitespace
-        if not line:  # Skip empty lines but maintain summary collection
-            if not in_summary:
-                clean_query.append(line)
-            continue
-            
-        if line.startswith("Context from"):
-            if current_summary:
-                summary_sections.append('\n'.join(current_summary))
-                current_summary = []
-            current_summary = [line]
-            in_summary = True
-        elif in_summary:
-            current_summary.append(line)
-        else:
-            clean_query.append(line)
-    
-    # Don't forget the last summary if there is one
-    if current_summary:
-        summary_sections.append('\n'.join(current_summary))
-        
-    # Start with the original prompt structure
-    prompt = (
+    # Fast path: most queries carry no embedded summary, so skip the regex
+    # split entirely when the marker is absent
+    if "Context from" not in query:
+        clean_query_text = query.strip()
+        summary_sections = []
+    else:
+        # Extract any summaries from the query (they follow "Context from"
+        # markers at line starts): one C-level split partitions the query
+        # into the user's question plus one chunk per summary
+        chunks = SUMMARY_SPLIT_PATTERN.split(query)
+        clean_query_text = ' '.join(chunks[0].split())
+        summary_sections = [
+            '\n'.join(line.strip() for line in chunk.splitlines() if line.strip())
+            for chunk in chunks[1:]
+        ]
+
+
+    # Build the prompt as a list of parts joined once at the end; repeated
+    # += on a string recopies the accumulated text for every context item
+    parts = [
         "You are a helpful assistant specializing in model risk management regulations. "
         "Your task is to:\n"
         "1. SYNTHESIZE information from ALL provided regulatory documents\n"
@@ -178,61 +231,82 @@ def create_synthetic_gpt_prompt(query: str, context: list) -> str:
         "5. ALWAYS cite specific documents, and page numbers for each key point\n\n"
         "If only one document provides relevant information, explicitly state this and explain "
         "what aspects other regulations might not cover.\n\n"
-    )
-        
+    ]
+
     # Add summary sections if they exist
     if summary_sections:
-        prompt += "Document Summaries:\n"
+        parts.append("Document Summaries:\n")
         for summary in summary_sections:
-            prompt += f"{summary}\n\n"
-            
+            parts.append(f"{summary}\n\n")
+
     # Add the search results
-    prompt += "Available Regulatory Context:\n"
-    
-    # Group context by document for better synthesis
-    docs_context = {}
-    for item in context:
-        doc_name = item.metadata.get('document_name', 'N/A')
-        if doc_name not in docs_context:
-            docs_context[doc_name] = []
-        docs_context[doc_name].append(item)
-    
-    # Present context grouped by document
-    for doc_name, items in docs_context.items():
-        prompt += f"\nFrom {doc_name}:\n"
+    parts.append("Available Regulatory Context:\n")
+
+    def doc_key(item):
+        return item.metadata.get('document_name', 'N/A')
+
+    # Present context grouped by document for better synthesis: sorting by
+    # document name makes equal documents adjacent, so groupby emits each
+    # group in one pass without materializing an intermediate dict
+    for doc_name, items in groupby(sorted(context, key=doc_key), key=doc_key):
+        parts.append(f"\nFrom {doc_name}:\n")
         for item in items:
             metadata = item.metadata
             section = metadata.get('section_name', 'N/A')
             page = metadata.get('page_start', 'N/A')
-            prompt += f"- [Section: {section}, p. {page}]\n{metadata.get('text', '')}\n"
-    
-    # Clean and join the query lines, ensuring there's actual content
-    clean_query_text = ' '.join(line for line in clean_query if line.strip())
+            parts.append(f"- [Section: {section}, p. {page}]\n{metadata.get('text', '')}\n")
+
+    # Ensure there's actual question content
     if not clean_query_text:  # If no clean query text, use the original query
         clean_query_text = query.strip()
-    
-    prompt += f"\nQuestion: {clean_query_text}\n\n"
-    prompt += "Provide a comprehensive answer that synthesizes all relevant regulatory perspectives:"
-    save_gpt_prompt(prompt)
 
-    save_gpt_prompt2(prompt, "prompts")
+    parts.append(f"\nQuestion: {clean_query_text}\n\n")
+    parts.append("Provide a comprehensive answer that synthesizes all relevant regulatory perspectives:")
+    prompt = ''.join(parts)
+    # Fire-and-forget: the prompt files are debugging artifacts, so the
+    # GPT call shouldn't wait on their disk writes
+    _PROMPT_IO_POOL.submit(persist_prompt, prompt)
 
     return prompt
 
 
 
+# Built once: get_friendly_document_name runs per rendered result, so the
+# mapping shouldn't be reallocated on every call
+DOCUMENT_MAPPING = {
+    "processed_ECB_GIM_Feb24_processed": "ECB GIM 2024",
+    "processed_ECB_TRIM2017_processed": "ECB TRIM 2017",
+    "processed_PRA_ss123_processed": "PRA SS1/23",
+    "processed_JFSA_2021_processed": "JFSA 2021",
+    "processed_FED_sr1107a1_processed": "FED SR 11-7"
+}
+
+
 def get_friendly_document_name(doc_name: str) -> str:
     """
     Convert processed filenames to friendly document names.
     """
-    document_mapping = {
-        "processed_ECB_GIM_Feb24_processed": "ECB GIM 2024",
-        "processed_ECB_TRIM2017_processed": "ECB TRIM 2017",
-        "processed_PRA_ss123_processed": "PRA SS1/23",
-        "processed_JFSA_2021_processed": "JFSA 2021",
-        "processed_FED_sr1107a1_processed": "FED SR 11-7"
-    }
-    return document_mapping.get(doc_name, doc_name)
+    return DOCUMENT_MAPPING.get(doc_name, doc_name)
+
+
+# Static sidebar HTML, defined once instead of inside the render functions
+CONTACT_HTML = """
+    <div style='color: #808080; font-size: 14px; padding: 10px 0;'>
+    Contact: <a href="mailto:georgios.argiris@gmail.com" style="color: #808080; text-decoration: none;">georgios.argiris@gmail.com</a>
+    </div>
+    """
+
+ABOUT_HTML = """
+    <div style='background-color: #f8f9fa; padding: 20px; border-radius: 5px; margin: 10px 0;'>
+    <h3 style='font-size: 18px; margin-bottom: 10px;'>About this Application</h3>
+    <p style='font-size: 16px; line-height: 1.5;'>
+    This chatbot provides an intelligent interface to banking regulations focused on model risk management.
+    It synthesizes information from multiple regulatory documents including ECB, PRA, FED, and JFSA guidelines.
+    The tool uses advanced natural language processing to understand queries and provide relevant, accurate responses
+    with proper citations to source documents.
+    </p>
+    </div>
+    """
 
 
 def display_sidebar_contact():
@@ -241,20 +315,17 @@ def display_sidebar_contact():
     """
     # Reduced number of breaks to move contact info higher
     st.markdown("<br>" *6, unsafe_allow_html=True)
-    
+
     # Add contact info with mailto link
-    st.markdown(
-        """
-        <div style='color: #808080; font-size: 14px; padding: 10px 0;'>
-        Contact: <a href="mailto:georgios.argiris@gmail.com" style="color: #808080; text-decoration: none;">georgios.argiris@gmail.com</a>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+    st.markdown(CONTACT_HTML, unsafe_allow_html=True)
 
+@st.fragment
 def setup_about_section():
     """
-    Creates a discrete About section with proper state management
+    Creates a discrete About section with proper state management.
+
+    Runs as a fragment so toggling the button reruns only this section,
+    not the whole app.
     """
     # Initialize the session state for about section visibility if it doesn't exist
     st.markdown("<br>" * 7  , unsafe_allow_html=True)
@@ -268,17 +339,4 @@ def setup_about_section():
     # Show about content only if state is True
     if st.session_state.show_about:
         with st.container():
-            st.markdown(
-                """
-                <div style='background-color: #f8f9fa; padding: 20px; border-radius: 5px; margin: 10px 0;'>
-                <h3 style='font-size: 18px; margin-bottom: 10px;'>About this Application</h3>
-                <p style='font-size: 16px; line-height: 1.5;'>
-                This chatbot provides an intelligent interface to banking regulations focused on model risk management. 
-                It synthesizes information from multiple regulatory documents including ECB, PRA, FED, and JFSA guidelines. 
-                The tool uses advanced natural language processing to understand queries and provide relevant, accurate responses 
-                with proper citations to source documents.
-                </p>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
\ No newline at end of file
+            st.markdown(ABOUT_HTML, unsafe_allow_html=True)
\ No newline at end of file